@@ -6,21 +6,36 @@ use std::{
   path::{Path, PathBuf},
   sync::{Arc, Mutex},
   thread,
-  time::Duration,
+  time::{Duration, SystemTime, UNIX_EPOCH},
 };
 
 use chrono::Local;
 use promptlab_core::analysis::{summarize_prompt_with_vocab, PromptAnalysis};
-use promptlab_core::storage::{Analysis, NewAnalysis, NewPrompt, Prompt, Storage, UpdatePrompt};
+use promptlab_core::storage::{Analysis, NewAnalysis, NewPrompt, Prompt, Storage, StorageError, UpdatePrompt};
 use serde::Deserialize;
 use serde_json::{json, Value};
 use tauri::{
   tray::{MouseButton, TrayIcon, TrayIconBuilder, TrayIconEvent},
-  Builder, Manager, State, WindowEvent,
+  Builder, Manager, RunEvent, State, WindowEvent,
 };
 use tauri_plugin_dialog::{DialogExt, MessageDialogButtons, MessageDialogKind};
 use tauri_plugin_single_instance::init as single_instance;
 
+const CSV_HEADER: [&str; 11] = [
+  "id",
+  "title",
+  "body",
+  "language",
+  "model_hint",
+  "metadata",
+  "created_at",
+  "updated_at",
+  "latest_summary",
+  "latest_tags",
+  "classification",
+];
+const URL_MARKERS: [&str; 5] = ["http://", "https://", ".com", ".net", ".org"];
+
 struct AppState {
   storage: Storage,
   log_path: PathBuf,
@@ -31,17 +46,28 @@ struct AppState {
 
 impl AppState {
   fn log(&self, message: &str) {
-    if let Err(error) = append_log(&self.log_path, message) {
-      eprintln!("failed to write log: {error}");
-    }
+    log_to(&self.log_path, message);
   }
 }
 
-fn append_log(path: &PathBuf, message: &str) -> std::io::Result<()> {
-  if let Some(parent) = path.parent() {
-    std::fs::create_dir_all(parent)?;
+fn log_to(path: &PathBuf, message: &str) {
+  if let Err(error) = append_log(path, message) {
+    eprintln!("failed to write log: {error}");
   }
-  let mut file = OpenOptions::new().create(true).append(true).open(path)?;
+}
+
+fn append_log(path: &PathBuf, message: &str) -> std::io::Result<()> {
+  let open = || OpenOptions::new().create(true).append(true).open(path);
+  // The data dir is created at startup; only recreate it if it has gone missing.
+  let mut file = match open() {
+    Err(error) if error.kind() == std::io::ErrorKind::NotFound => {
+      if let Some(parent) = path.parent() {
+        std::fs::create_dir_all(parent)?;
+      }
+      open()?
+    }
+    result => result?,
+  };
   writeln!(file, "[{}] {message}", Local::now().format("%Y-%m-%d %H:%M:%S"))?;
   Ok(())
 }
@@ -73,14 +99,32 @@ struct AnalysisPayload {
   qwen_model: Option<String>,
 }
 
+// Analysis is CPU-bound (the first call also loads the jieba dictionary), so it
+// runs on the blocking thread pool instead of the main thread or an async worker.
 #[tauri::command]
-fn summarize_prompt(state: State<AppState>, body: &str) -> PromptAnalysis {
+async fn summarize_prompt(state: State<'_, AppState>, body: String) -> Result<PromptAnalysis, String> {
   let vocabulary = state.vocabulary.lock().unwrap().clone();
-  summarize_prompt_with_vocab(body, &vocabulary)
+  tauri::async_runtime::spawn_blocking(move || summarize_prompt_with_vocab(&body, &vocabulary))
+    .await
+    .map_err(|error| error.to_string())
+}
+
+// rusqlite (and the storage writer lock) block, so storage-backed commands hand the
+// call to the blocking thread pool instead of running it on the main thread or
+// parking an async worker. Concurrent invokes each get their own pooled connection.
+async fn run_storage<T, F>(state: &AppState, op: F) -> Result<T, String>
+where
+  F: FnOnce(&Storage) -> Result<T, StorageError> + Send + 'static,
+  T: Send + 'static,
+{
+  let storage = state.storage.clone();
+  tauri::async_runtime::spawn_blocking(move || op(&storage).map_err(|error| error.to_string()))
+    .await
+    .map_err(|error| error.to_string())?
 }
 
 #[tauri::command]
-fn save_prompt(state: State<AppState>, payload: PromptPayload) -> Result<Prompt, String> {
+async fn save_prompt(state: State<'_, AppState>, payload: PromptPayload) -> Result<Prompt, String> {
   let PromptPayload {
     title,
     body,
@@ -93,37 +137,41 @@ fn save_prompt(state: State<AppState>, payload: PromptPayload) -> Result<Prompt,
   record.model_hint = model_hint;
   record.metadata = metadata.unwrap_or(Value::Null);
 
-  state
-    .storage
-    .create_prompt(record)
+  run_storage(&state, move |storage| storage.create_prompt(record))
+    .await
     .map(|prompt| {
       state.log(&format!("创建 Prompt 成功: {}", prompt.id));
       prompt
     })
     .map_err(|error| {
       state.log(&format!("创建 Prompt 失败: {error}"));
-      error.to_string()
+      error
     })
 }
 
 #[tauri::command]
-fn list_prompts(state: State<AppState>) -> Result<Vec<Prompt>, String> {
-  state.storage.list_prompts().map_err(|error| {
-    state.log(&format!("获取 Prompt 列表失败: {error}"));
-    error.to_string()
-  })
+async fn list_prompts(state: State<'_, AppState>) -> Result<Vec<Prompt>, String> {
+  run_storage(&state, |storage| storage.list_prompts())
+    .await
+    .map_err(|error| {
+      state.log(&format!("获取 Prompt 列表失败: {error}"));
+      error
+    })
 }
 
 #[tauri::command]
-fn get_prompt(state: State<AppState>, id: String) -> Result<Option<Prompt>, String> {
-  state.storage.get_prompt(&id).map_err(|error| {
-    state.log(&format!("获取 Prompt {id} 失败: {error}"));
-    error.to_string()
-  })
+async fn get_prompt(state: State<'_, AppState>, id: String) -> Result<Option<Prompt>, String> {
+  let key = id.clone();
+  run_storage(&state, move |storage| storage.get_prompt(&key))
+    .await
+    .map_err(|error| {
+      state.log(&format!("获取 Prompt {id} 失败: {error}"));
+      error
+    })
 }
 
 #[tauri::command]
-fn update_prompt(state: State<AppState>, id: String, payload: UpdatePromptPayload) -> Result<Prompt, String> {
+async fn update_prompt(state: State<'_, AppState>, id: String, payload: UpdatePromptPayload) -> Result<Prompt, String> {
   let UpdatePromptPayload {
     title,
     body,
@@ -139,12 +187,12 @@ fn update_prompt(state: State<AppState>, id: String, payload: UpdatePromptPayloa
   patch.model_hint = model_hint;
   patch.metadata = metadata;
 
-  state
-    .storage
-    .update_prompt(&id, patch)
+  let key = id.clone();
+  run_storage(&state, move |storage| storage.update_prompt(&key, patch))
+    .await
     .map_err(|error| {
       state.log(&format!("更新 Prompt {id} 失败: {error}"));
-      error.to_string()
+      error
     })?
     .ok_or_else(|| {
       state.log(&format!("更新 Prompt {id} 失败: 未找到"));
@@ -153,22 +201,37 @@ fn update_prompt(state: State<AppState>, id: String, payload: UpdatePromptPayloa
 }
 
 #[tauri::command]
-fn delete_prompt(state: State<AppState>, id: String) -> Result<bool, String> {
-  state
-    .storage
-    .delete_prompt(&id)
+async fn delete_prompt(state: State<'_, AppState>, id: String) -> Result<bool, String> {
+  let key = id.clone();
+  run_storage(&state, move |storage| storage.delete_prompt(&key))
+    .await
     .map(|result| {
       state.log(&format!("删除 Prompt {id} => {result}"));
       result
     })
     .map_err(|error| {
       state.log(&format!("删除 Prompt {id} 失败: {error}"));
-      error.to_string()
+      error
+    })
+}
+
+#[tauri::command]
+async fn delete_prompts(state: State<'_, AppState>, ids: Vec<String>) -> Result<usize, String> {
+  let requested = ids.len();
+  run_storage(&state, move |storage| storage.delete_prompts(&ids))
+    .await
+    .map(|count| {
+      state.log(&format!("批量删除 Prompt {count}/{requested}"));
+      count
+    })
+    .map_err(|error| {
+      state.log(&format!("批量删除 Prompt 失败: {error}"));
+      error
     })
 }
 
 #[tauri::command]
-fn record_analysis(state: State<AppState>, payload: AnalysisPayload) -> Result<Analysis, String> {
+async fn record_analysis(state: State<'_, AppState>, payload: AnalysisPayload) -> Result<Analysis, String> {
   let AnalysisPayload {
     prompt_id,
     summary,
@@ -184,40 +247,58 @@ fn record_analysis(state: State<AppState>, payload: AnalysisPayload) -> Result<A
     qwen_model,
   };
 
-  state.storage.create_analysis(entry).map_err(|error| {
-    state.log(&format!("写入分析失败: {error}"));
-    error.to_string()
-  })
+  run_storage(&state, move |storage| storage.create_analysis(entry))
+    .await
+    .map_err(|error| {
+      state.log(&format!("写入分析失败: {error}"));
+      error
+    })
 }
 
 #[tauri::command]
-fn list_analyses(state: State<AppState>, prompt_id: String) -> Result<Vec<Analysis>, String> {
+async fn list_analyses(state: State<'_, AppState>, prompt_id: String) -> Result<Vec<Analysis>, String> {
   state.log(&format!("list_analyses called with prompt_id={prompt_id}"));
-  match state.storage.list_analyses_for_prompt(&prompt_id) {
+  let key = prompt_id.clone();
+  match run_storage(&state, move |storage| storage.list_analyses_for_prompt(&key)).await {
     Ok(list) => {
       state.log(&format!("list_analyses prompt_id={prompt_id} -> {} rows", list.len()));
       Ok(list)
     }
     Err(error) => {
       state.log(&format!("获取 Prompt {prompt_id} 分析失败: {error}"));
-      Err(error.to_string())
+      Err(error)
     }
   }
 }
 
 #[tauri::command]
-fn latest_analysis(state: State<AppState>, prompt_id: String) -> Result<Option<Analysis>, String> {
-  state
-    .storage
-    .latest_analysis_for_prompt(&prompt_id)
+async fn latest_analysis(state: State<'_, AppState>, prompt_id: String) -> Result<Option<Analysis>, String> {
+  let key = prompt_id.clone();
+  run_storage(&state, move |storage| storage.latest_analysis_for_prompt(&key))
+    .await
     .map_err(|error| {
       state.log(&format!("获取 Prompt {prompt_id} 最新分析失败: {error}"));
-      error.to_string()
+      error
     })
 }
 
 #[tauri::command]
-fn export_prompts_csv(state: State<AppState>, target_path: Option<String>) -> Result<String, String> {
+async fn export_prompts_csv(state: State<'_, AppState>, target_path: Option<String>) -> Result<String, String> {
+  // File and SQLite I/O both block, so the whole export runs on the blocking pool.
+  let storage = state.storage.clone();
+  let export_dir = state.export_dir.clone();
+  let log_path = state.log_path.clone();
+  tauri::async_runtime::spawn_blocking(move || write_csv_export(&storage, &export_dir, &log_path, target_path))
+    .await
+    .map_err(|error| error.to_string())?
+}
+
+fn write_csv_export(
+  storage: &Storage,
+  export_dir: &Path,
+  log_path: &PathBuf,
+  target_path: Option<String>,
+) -> Result<String, String> {
   let file_path = if let Some(custom_path) = target_path {
     let path = PathBuf::from(custom_path);
     if let Some(parent) = path.parent() {
@@ -225,73 +306,72 @@ fn export_prompts_csv(state: State<AppState>, target_path: Option<String>) -> Re
     }
     path
   } else {
-    std::fs::create_dir_all(&state.export_dir).map_err(|error| error.to_string())?;
+    std::fs::create_dir_all(export_dir).map_err(|error| error.to_string())?;
     let file_name = format!("prompts-{}.csv", Local::now().format("%Y%m%d-%H%M%S"));
-    state.export_dir.join(file_name)
+    export_dir.join(file_name)
   };
-  let prompts = state
-    .storage
-    .list_prompts()
-    .map_err(|error| {
-      state.log(&format!("导出 prompts 失败: {error}"));
-      error.to_string()
-    })?;
+  // Rows are written to a sibling temp file and only renamed over the target once
+  // complete, so a failed query never leaves a truncated CSV at the user's path.
+  let mut partial_path = file_path.clone().into_os_string();
+  partial_path.push(".partial");
+  let partial_path = PathBuf::from(partial_path);
+  if let Err(error) = write_csv_rows(storage, &partial_path, log_path) {
+    let _ = std::fs::remove_file(&partial_path);
+    return Err(error);
+  }
+  std::fs::rename(&partial_path, &file_path).map_err(|error| {
+    let _ = std::fs::remove_file(&partial_path);
+    log_to(log_path, &format!("保存导出文件失败: {error}"));
+    error.to_string()
+  })?;
+  Ok(file_path.to_string_lossy().to_string())
+}
 
-  let mut file = std::fs::File::create(&file_path).map_err(|error| {
-    state.log(&format!("创建导出文件失败: {error}"));
+fn write_csv_rows(storage: &Storage, file_path: &Path, log_path: &PathBuf) -> Result<(), String> {
+  let mut file = std::fs::File::create(file_path).map_err(|error| {
+    log_to(log_path, &format!("创建导出文件失败: {error}"));
     error.to_string()
   })?;
   // Write UTF-8 BOM to improve compatibility with Excel
   if let Err(err) = file.write_all(&[0xEF, 0xBB, 0xBF]) {
-    state.log(&format!("写入 BOM 失败: {err}"));
+    log_to(log_path, &format!("写入 BOM 失败: {err}"));
   }
   let mut writer = csv::Writer::from_writer(file);
   writer
-    .write_record([
-      "id",
-      "title",
-      "body",
-      "language",
-      "model_hint",
-      "metadata",
-      "created_at",
-      "updated_at",
-      "latest_summary",
-      "latest_tags",
-      "classification",
-    ])
+    .write_record(CSV_HEADER)
     .map_err(|error| error.to_string())?;
 
-  for prompt in prompts {
-    let analyses = state
-      .storage
-      .list_analyses_for_prompt(&prompt.id)
-      .map_err(|error| error.to_string())?;
-    let latest = analyses.first();
-    let summary = latest.map(|entry| entry.summary.as_str()).unwrap_or_default();
-    let tags = latest.map(|entry| entry.tags.join("|")).unwrap_or_default();
-    let classification = latest
-      .map(|entry| entry.classification.to_string())
-      .unwrap_or_else(|| "null".into());
-
-    writer
-      .write_record([
-        prompt.id.clone(),
-        prompt.title.clone(),
-        prompt.body.replace('\n', " ").replace('\r', " "),
-        prompt.language.clone().unwrap_or_default(),
-        prompt.model_hint.clone().unwrap_or_default(),
+  // Rows are written as the cursor yields them; the latest analysis comes from the same query.
+  storage
+    .for_each_prompt_with_latest_analysis(|prompt, latest| -> Result<(), Box<dyn std::error::Error>> {
+      let latest = latest.as_ref();
+      let summary = latest.map(|entry| entry.summary.as_str()).unwrap_or_default();
+      let tags = latest.map(|entry| entry.tags.join("|")).unwrap_or_default();
+      let classification = latest
+        .map(|entry| entry.classification.to_string())
+        .unwrap_or_else(|| "null".into());
+
+      writer.write_record([
+        prompt.id,
+        prompt.title,
+        prompt.body.replace(&['\n', '\r'][..], " "),
+        prompt.language.unwrap_or_default(),
+        prompt.model_hint.unwrap_or_default(),
         prompt.metadata.to_string(),
         prompt.created_at.to_rfc3339(),
         prompt.updated_at.to_rfc3339(),
         summary.to_string(),
         tags,
         classification,
-      ])
-      .map_err(|error| error.to_string())?;
-  }
+      ])?;
+      Ok(())
+    })
+    .map_err(|error| {
+      log_to(log_path, &format!("导出 prompts 失败: {error}"));
+      error.to_string()
+    })?;
   writer.flush().map_err(|error| error.to_string())?;
-  Ok(file_path.to_string_lossy().to_string())
+  Ok(())
 }
 
 #[tauri::command]
@@ -335,14 +415,8 @@ fn remove_vocabulary_entry(state: State<AppState>, term: String) -> Result<Vec<S
 
 fn main() {
   Builder::default()
-    .plugin(tauri_plugin_shell::init())
     .plugin(tauri_plugin_dialog::init())
-    .plugin(single_instance(|app, _argv, _cwd| {
-      if let Some(window) = app.get_webview_window("main") {
-        let _ = window.show();
-        let _ = window.set_focus();
-      }
-    }))
+    .plugin(single_instance(|app, _argv, _cwd| show_main_window(app)))
     .on_window_event(|window, event| {
       if let WindowEvent::CloseRequested { api, .. } = event {
         // Hide to tray instead of quitting.
@@ -376,27 +450,14 @@ fn main() {
 
       let _tray: TrayIcon = TrayIconBuilder::new()
         .on_tray_icon_event(|tray, event| match event {
-          TrayIconEvent::Click { button, .. } => {
-            if button == MouseButton::Left {
-              if let Some(window) = tray.app_handle().get_webview_window("main") {
-                let _ = window.show();
-                let _ = window.set_focus();
-              }
-            } else if button == MouseButton::Right {
-              let app_handle = tray.app_handle().clone();
-              app_handle
-                .dialog()
-                .message("确定要退出 PromptLab 吗？")
-                .title("退出应用")
-                .kind(MessageDialogKind::Warning)
-                .buttons(MessageDialogButtons::OkCancel)
-                .show(move |ok| {
-                  if ok {
-                    app_handle.exit(0);
-                  }
-                });
-            }
-          }
+          TrayIconEvent::Click {
+            button: MouseButton::Left,
+            ..
+          } => show_main_window(tray.app_handle()),
+          TrayIconEvent::Click {
+            button: MouseButton::Right,
+            ..
+          } => confirm_exit(tray.app_handle()),
           _ => {}
         })
         .build(app)?;
@@ -412,6 +473,7 @@ fn main() {
       get_prompt,
       update_prompt,
       delete_prompt,
+      delete_prompts,
       record_analysis,
       list_analyses,
       latest_analysis,
@@ -420,8 +482,39 @@ fn main() {
       add_vocabulary_entry,
       remove_vocabulary_entry
     ])
-    .run(tauri::generate_context!())
-    .expect("error while running PromptLab desktop app");
+    .build(tauri::generate_context!())
+    .expect("error while building PromptLab desktop app")
+    .run(|app_handle, event| {
+      if let RunEvent::Exit = event {
+        if let Some(state) = app_handle.try_state::<AppState>() {
+          if let Err(error) = state.storage.optimize() {
+            state.log(&format!("PRAGMA optimize 失败: {error}"));
+          }
+        }
+      }
+    });
+}
+
+fn show_main_window(app: &tauri::AppHandle) {
+  if let Some(window) = app.get_webview_window("main") {
+    let _ = window.show();
+    let _ = window.set_focus();
+  }
+}
+
+fn confirm_exit(app: &tauri::AppHandle) {
+  let app_handle = app.clone();
+  app
+    .dialog()
+    .message("确定要退出 PromptLab 吗？")
+    .title("退出应用")
+    .kind(MessageDialogKind::Warning)
+    .buttons(MessageDialogButtons::OkCancel)
+    .show(move |ok| {
+      if ok {
+        app_handle.exit(0);
+      }
+    });
 }
 
 fn start_clipboard_watcher(app_handle: tauri::AppHandle) {
@@ -431,12 +524,8 @@ fn start_clipboard_watcher(app_handle: tauri::AppHandle) {
   let log_path = state.log_path.clone();
 
   thread::spawn(move || {
-    let mut clipboard = match arboard::Clipboard::new() {
-      Ok(cb) => cb,
-      Err(err) => {
-        let _ = append_log(&log_path, &format!("clipboard init failed: {err}"));
-        return;
-      }
+    let Some(mut clipboard) = open_clipboard(&log_path) else {
+      return;
     };
 
     let mut last = String::new();
@@ -517,6 +606,36 @@ fn start_clipboard_watcher(app_handle: tauri::AppHandle) {
   });
 }
 
+/// Open the system clipboard, retrying transient failures (e.g. the display
+/// server not being ready right after login) before giving up on the watcher.
+fn open_clipboard(log_path: &PathBuf) -> Option<arboard::Clipboard> {
+  const ATTEMPTS: u32 = 3;
+  for attempt in 0..ATTEMPTS {
+    match arboard::Clipboard::new() {
+      Ok(clipboard) => return Some(clipboard),
+      Err(err) => {
+        let _ = append_log(
+          log_path,
+          &format!("clipboard init failed (attempt {}/{ATTEMPTS}): {err}", attempt + 1),
+        );
+        if attempt + 1 < ATTEMPTS {
+          thread::sleep(backoff_delay(attempt));
+        }
+      }
+    }
+  }
+  None
+}
+
+/// Exponential backoff (1s, 2s, 4s, ...) plus up to 500ms of jitter.
+fn backoff_delay(attempt: u32) -> Duration {
+  let jitter_ms = SystemTime::now()
+    .duration_since(UNIX_EPOCH)
+    .map(|elapsed| u64::from(elapsed.subsec_millis() % 500))
+    .unwrap_or(0);
+  Duration::from_secs(1 << attempt) + Duration::from_millis(jitter_ms)
+}
+
 fn normalize_vocab_term(term: &str) -> String {
   let cleaned = term.trim();
   if cleaned.chars().all(|c| c.is_ascii()) {
@@ -540,20 +659,27 @@ fn is_potential_prompt(text: &str) -> bool {
   if trimmed.is_empty() {
     return false;
   }
-  let len = trimmed.chars().count();
+  // Stop counting once past the limit; large clipboard payloads need not be walked in full.
+  let len = trimmed.chars().take(601).count();
   if len < 8 || len > 600 {
     return false;
   }
-  let lines: Vec<&str> = trimmed.lines().collect();
-  if lines.len() > 12 {
-    return false;
+  // Count lines and "speaker:" style lines in one pass, bailing out early on long pastes.
+  let mut line_count = 0;
+  let mut chat_like = 0;
+  for line in trimmed.lines() {
+    line_count += 1;
+    if line_count > 12 {
+      return false;
+    }
+    if line.contains(|c| c == ':' || c == '：') {
+      chat_like += 1;
+    }
   }
-  let chat_like = lines.iter().filter(|line| line.contains(':') || line.contains('：')).count();
   if chat_like >= 6 {
     return false;
   }
-  let url_like = ["http://", "https://", ".com", ".net", ".org"];
-  let url_hits = url_like.iter().filter(|pat| trimmed.contains(*pat)).count();
+  let url_hits = URL_MARKERS.iter().filter(|pat| trimmed.contains(*pat)).count();
   if url_hits >= 3 {
     return false;
   }
@@ -579,18 +705,16 @@ fn build_structured_body(analysis: &PromptAnalysis, original: &str) -> String {
 }
 
 fn load_vocabulary(path: &Path) -> Vec<String> {
-  if path.exists() {
-    if let Ok(data) = std::fs::read_to_string(path) {
-      if let Ok(entries) = serde_json::from_str::<Vec<String>>(&data) {
-        let mut cleaned: Vec<String> = entries
-          .into_iter()
-          .map(|item| normalize_vocab_term(&item))
-          .filter(|item| !item.is_empty())
-          .collect();
-        cleaned.sort();
-        cleaned.dedup();
-        return cleaned;
-      }
+  if let Ok(data) = std::fs::read_to_string(path) {
+    if let Ok(entries) = serde_json::from_str::<Vec<String>>(&data) {
+      let mut cleaned: Vec<String> = entries
+        .into_iter()
+        .map(|item| normalize_vocab_term(&item))
+        .filter(|item| !item.is_empty())
+        .collect();
+      cleaned.sort();
+      cleaned.dedup();
+      return cleaned;
     }
   }
   Vec::new()
@@ -207,30 +207,37 @@ export default function App() {
     setIsLoading(true);
     setStatus("正在提炼主题...");
 
+    // Saving a new draft does not depend on the analysis, so run both at once.
+    // The draft is kept even if the analysis fails; the status says so.
+    const pendingSave = activePromptId
+      ? null
+      : persistPrompt().then(
+          () => null,
+          (error) => (error instanceof Error ? error.message : "自动保存失败"),
+        );
+
+    let analysisFailed = false;
     try {
       const result = await invoke<PromptAnalysis>("summarize_prompt", { body: prompt });
       setAnalysis(result);
       setTopicOverride(result.theme ?? result.topic ?? "");
       setTagInput(result.suggestedTags.join(", "));
       setStatus("分析完成，可手动调整主题/标签后保存分析");
-
-      let promptId = activePromptId;
-      if (!promptId) {
-        try {
-          const saved = await persistPrompt();
-          promptId = saved.id;
-          setStatus("已保存并记录本次分析");
-        } catch (error) {
-          const message = error instanceof Error ? error.message : "自动保存失败";
-          setStatus(message);
-          return;
-        }
-      }
-
     } catch (err) {
       console.error(err);
+      analysisFailed = true;
       setStatus("分析失败，请查看日志");
     } finally {
+      // Keep the button disabled until the save settles, otherwise a second click
+      // (activePromptId still null) would create a duplicate prompt.
+      if (pendingSave) {
+        const saveError = await pendingSave;
+        if (analysisFailed) {
+          setStatus(saveError ? `分析失败，${saveError}` : "分析失败（草稿已保存），请查看日志");
+        } else {
+          setStatus(saveError ?? "已保存并记录本次分析");
+        }
+      }
       setIsLoading(false);
     }
   };
@@ -398,7 +405,7 @@ export default function App() {
     }
     setStatus("����ɾ����...");
     try {
-      await Promise.all(selectedIds.map((id) => invoke<boolean>("delete_prompt", { id })));
+      await invoke<number>("delete_prompts", { ids: selectedIds });
       setHistory((prev) => prev.filter((item) => !selectedIds.includes(item.id)));
       if (activePromptId && selectedIds.includes(activePromptId)) {
         handleNewDraft();
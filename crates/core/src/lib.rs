@@ -2,6 +2,7 @@ pub mod analysis {
     use jieba_rs::Jieba;
     use once_cell::sync::Lazy;
     use serde::{Deserialize, Serialize};
+    use std::borrow::Cow;
     use std::collections::{HashMap, HashSet};
     use uuid::Uuid;
 
@@ -50,6 +51,16 @@ pub mod analysis {
         .into_iter()
         .collect()
     });
+    const MAX_KEYWORDS: usize = 8;
+    const ROLE_PATTERNS: [&str; 7] = [
+        "\u{4f5c}\u{4e3a}", // 作为
+        "\u{4f60}\u{662f}", // 你是
+        "\u{4f60}\u{5c06}", // 你将
+        "\u{62c5}\u{4efb}", // 担任
+        "\u{626e}\u{6f14}", // 扮演
+        "role:",
+        "角色",
+    ];
     const TARGET_MARKERS: [&str; 7] = [
         "\u{9762}\u{5411}",
         "\u{9488}\u{5bf9}",
@@ -115,32 +126,25 @@ pub mod analysis {
         if text.is_empty() {
             return Vec::new();
         }
-        TOKENIZER
-            .cut(text, true)
-            .into_iter()
-            .flat_map(|token| {
-                let owned = token.to_string();
-                if owned.is_empty() {
-                    return Vec::new();
-                }
-                if owned.chars().all(|c| c.is_ascii()) {
-                    owned
+        // Work on the borrowed jieba slices and only allocate for tokens we keep.
+        let mut tokens = Vec::new();
+        for token in TOKENIZER.cut(text, true) {
+            if token.is_ascii() {
+                tokens.extend(
+                    token
                         .split_whitespace()
-                        .map(|t| trim_punctuation(t).to_string())
-                        .filter(|t| !t.is_empty())
-                        .map(|t| t.to_lowercase())
-                        .filter(|t| !is_noise_ascii(t))
-                        .collect::<Vec<_>>()
-                } else {
-                    let cleaned = trim_punctuation(&owned);
-                    if cleaned.is_empty() {
-                        Vec::new()
-                    } else {
-                        vec![cleaned.to_string()]
-                    }
+                        .map(trim_punctuation)
+                        .filter(|t| !t.is_empty() && !is_noise_ascii(t))
+                        .map(str::to_ascii_lowercase),
+                );
+            } else {
+                let cleaned = trim_punctuation(token);
+                if !cleaned.is_empty() {
+                    tokens.push(cleaned.to_string());
                 }
-            })
-            .collect()
+            }
+        }
+        tokens
     }
 
     fn extract_keywords(tokens: &[String], text: &str, vocabulary: &[String]) -> Vec<String> {
@@ -149,29 +153,40 @@ pub mod analysis {
             if !is_meaningful(token) || is_numeric_token(token) {
                 continue;
             }
-            let normalized = normalize_token(token);
-            if normalized.is_empty() || STOPWORDS.contains(normalized.as_str()) {
+            let normalized = normalize_token_ref(token);
+            if normalized.is_empty() || STOPWORDS.contains(normalized.as_ref()) {
                 continue;
             }
-            *freq.entry(normalized).or_insert(0) += 1;
+            // Only allocate a key the first time a keyword is seen.
+            match freq.get_mut(normalized.as_ref()) {
+                Some(count) => *count += 1,
+                None => {
+                    freq.insert(normalized.into_owned(), 1);
+                }
+            }
         }
 
         boost_vocabulary_terms(&mut freq, text, vocabulary);
 
-        let mut ranked: Vec<(String, usize)> = freq.into_iter().collect();
-        ranked.sort_by(|(a_token, a_count), (b_token, b_count)| {
+        let mut ranked: Vec<(String, usize)> = freq
+            .into_iter()
+            .filter(|(token, _)| token.chars().count() >= 2 || token.len() >= 4)
+            .collect();
+        let rank = |(a_token, a_count): &(String, usize), (b_token, b_count): &(String, usize)| {
             b_count
                 .cmp(a_count)
                 .then_with(|| b_token.len().cmp(&a_token.len()))
                 .then_with(|| a_token.cmp(b_token))
-        });
+        };
 
-        ranked
-            .into_iter()
-            .map(|(token, _)| token)
-            .filter(|token| token.chars().count() >= 2 || token.len() >= 4)
-            .take(8)
-            .collect()
+        // Only the top few survive, so partition them out in O(n) and sort just those.
+        if ranked.len() > MAX_KEYWORDS {
+            ranked.select_nth_unstable_by(MAX_KEYWORDS, rank);
+            ranked.truncate(MAX_KEYWORDS);
+        }
+        ranked.sort_by(rank);
+
+        ranked.into_iter().map(|(token, _)| token).collect()
     }
 
     fn boost_vocabulary_terms(freq: &mut HashMap<String, usize>, text: &str, vocabulary: &[String]) {
@@ -241,21 +256,12 @@ pub mod analysis {
 
     fn derive_role(text: &str) -> String {
         let window: String = text.chars().take(200).collect();
-        let patterns = [
-            "\u{4f5c}\u{4e3a}", // 作为
-            "\u{4f60}\u{662f}", // 你是
-            "\u{4f60}\u{5c06}", // 你将
-            "\u{62c5}\u{4efb}", // 担任
-            "\u{626e}\u{6f14}", // 扮演
-            "role:",
-            "角色",
-        ];
         for part in window.split(|c| matches!(c, '\u{ff0c}' | '\u{3002}' | '\u{ff1b}' | '\u{ff1a}' | '.' | ';')) {
             let trimmed = part.trim();
             if trimmed.is_empty() {
                 continue;
             }
-            if patterns.iter().any(|p| trimmed.contains(p)) {
+            if ROLE_PATTERNS.iter().any(|p| trimmed.contains(p)) {
                 return trimmed.chars().take(48).collect();
             }
         }
@@ -312,17 +318,20 @@ pub mod analysis {
         })
     }
 
-    fn normalize_token(token: &str) -> String {
+    /// Trim punctuation and lowercase ASCII tokens, borrowing when the token is
+    /// already normalized (the usual case for `tokenize` output).
+    fn normalize_token_ref(token: &str) -> Cow<'_, str> {
         let cleaned = trim_punctuation(token);
-        if cleaned.is_empty() {
-            return String::new();
-        }
-        if cleaned.chars().all(|c| c.is_ascii()) {
-            cleaned.to_lowercase()
+        if cleaned.is_ascii() && cleaned.bytes().any(|b| b.is_ascii_uppercase()) {
+            Cow::Owned(cleaned.to_ascii_lowercase())
         } else {
-            cleaned.to_string()
+            Cow::Borrowed(cleaned)
         }
     }
+
+    fn normalize_token(token: &str) -> String {
+        normalize_token_ref(token).into_owned()
+    }
 }
 
 pub mod prompts {
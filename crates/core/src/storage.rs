@@ -1,9 +1,13 @@
-use std::{path::Path, time::Duration};
+use std::{
+    path::Path,
+    sync::{Arc, Mutex, MutexGuard, PoisonError},
+    time::Duration,
+};
 
 use chrono::{DateTime, Utc};
 use r2d2::{Pool, PooledConnection};
 use r2d2_sqlite::SqliteConnectionManager;
-use rusqlite::{params, OptionalExtension};
+use rusqlite::{params, types::FromSqlError, OptionalExtension, TransactionBehavior};
 use serde::{Deserialize, Serialize};
 use serde_json::Value;
 use thiserror::Error;
@@ -12,10 +16,58 @@ use uuid::Uuid;
 /// Alias for pooled SQLite connections.
 pub type DbPool = Pool<SqliteConnectionManager>;
 
+const POOL_MAX_SIZE: u32 = 8;
+const POOL_MIN_IDLE: u32 = 2;
+
+// Hot-path SQL lives in constants and goes through `prepare_cached`, so each pooled
+// connection compiles a statement once and reuses it on later calls.
+const SQL_INSERT_PROMPT: &str = r#"
+    INSERT INTO prompts (id, title, body, language, model_hint, metadata, created_at, updated_at, body_hash)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9)
+"#;
+const SQL_UPDATE_PROMPT: &str = r#"
+    UPDATE prompts
+    SET title = ?2,
+        body = ?3,
+        language = ?4,
+        model_hint = ?5,
+        metadata = ?6,
+        updated_at = ?7,
+        body_hash = ?8
+    WHERE id = ?1
+"#;
+const SQL_SELECT_PROMPT: &str =
+    "SELECT id, title, body, language, model_hint, metadata, created_at, updated_at FROM prompts WHERE id = ?1";
+const SQL_FIND_PROMPT_BY_BODY: &str = "SELECT id, title, body, language, model_hint, metadata, created_at, updated_at
+     FROM prompts
+     WHERE body_hash = ?1 AND body = ?2
+     LIMIT 1";
+const SQL_DELETE_PROMPT: &str = "DELETE FROM prompts WHERE id = ?1";
+const SQL_INSERT_ANALYSIS: &str = r#"
+    INSERT INTO analyses (id, prompt_id, summary, tags, classification, qwen_model, created_at)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7)
+"#;
+const SQL_LIST_ANALYSES_FOR_PROMPT: &str = "SELECT id, prompt_id, summary, tags, classification, qwen_model, created_at
+     FROM analyses
+     WHERE prompt_id = ?1
+     ORDER BY datetime(created_at) DESC";
+const SQL_LATEST_ANALYSIS_FOR_PROMPT: &str = "SELECT id, prompt_id, summary, tags, classification, qwen_model, created_at
+     FROM analyses
+     WHERE prompt_id = ?1
+     ORDER BY datetime(created_at) DESC
+     LIMIT 1";
+
 /// Lightweight data-access layer for prompts, analyses, and attachments.
+///
+/// Every method blocks: it runs synchronous rusqlite calls, and writes first wait
+/// on an in-process writer lock. Never call it directly from an async task; use a
+/// dedicated thread or a blocking pool (e.g. `spawn_blocking`) instead.
 #[derive(Clone)]
 pub struct Storage {
     pool: DbPool,
+    /// Shared by all clones so writes from commands and the clipboard watcher queue
+    /// in-process instead of contending for SQLite's single write lock.
+    writer: Arc<Mutex<()>>,
 }
 
 impl Storage {
@@ -36,23 +88,46 @@ impl Storage {
                  PRAGMA temp_store = MEMORY;
                  PRAGMA cache_size = -8000;         -- ~8MB page cache
                  PRAGMA mmap_size = 268435456;      -- 256MB mmap, best-effort
-                 PRAGMA page_size = 4096;",
+                 PRAGMA page_size = 4096;
+                 PRAGMA optimize = 0x10002;         -- refresh planner stats on open",
             )?;
             Ok(())
         });
 
-        let pool = Pool::new(manager)?;
-        let storage = Self { pool };
+        // Keep a couple of connections warm for reuse and open the rest on demand,
+        // instead of r2d2's default of eagerly opening (and initialising) all of them.
+        let pool = Pool::builder()
+            .max_size(POOL_MAX_SIZE)
+            .min_idle(Some(POOL_MIN_IDLE))
+            .build(manager)?;
+        let storage = Self {
+            pool,
+            writer: Arc::new(Mutex::new(())),
+        };
         storage.run_migrations()?;
         Ok(storage)
     }
 
+    /// Let SQLite refresh planner statistics; intended to run once at shutdown.
+    pub fn optimize(&self) -> Result<(), StorageError> {
+        let conn = self.conn()?;
+        conn.execute_batch("PRAGMA optimize;")?;
+        Ok(())
+    }
+
     fn conn(&self) -> Result<PooledConnection<SqliteConnectionManager>, StorageError> {
         Ok(self.pool.get()?)
     }
 
+    /// Hold for the duration of a write. Readers never take it, so they keep running
+    /// concurrently on their own pooled connections (WAL). This is a blocking
+    /// `std::sync::Mutex`; see the type-level note about async callers.
+    fn write_guard(&self) -> MutexGuard<'_, ()> {
+        self.writer.lock().unwrap_or_else(PoisonError::into_inner)
+    }
+
     fn run_migrations(&self) -> Result<(), StorageError> {
-        let conn = self.conn()?;
+        let mut conn = self.conn()?;
         conn.execute_batch(
             r#"
             CREATE TABLE IF NOT EXISTS prompts (
@@ -63,7 +138,8 @@ impl Storage {
                 model_hint TEXT,
                 metadata TEXT NOT NULL,
                 created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL
+                updated_at TEXT NOT NULL,
+                body_hash TEXT
             );
             CREATE INDEX IF NOT EXISTS idx_prompts_updated_at ON prompts (datetime(updated_at));
             CREATE INDEX IF NOT EXISTS idx_prompts_created_at ON prompts (datetime(created_at));
@@ -91,41 +167,74 @@ impl Storage {
             CREATE INDEX IF NOT EXISTS idx_attachments_prompt_id ON attachments (prompt_id);
             "#,
         )?;
+
+        // Databases created before `body_hash` existed need the column added and backfilled.
+        let has_body_hash = conn.query_row(
+            "SELECT COUNT(*) FROM pragma_table_info('prompts') WHERE name = 'body_hash'",
+            [],
+            |row| row.get::<_, i64>(0),
+        )? > 0;
+        if !has_body_hash {
+            conn.execute_batch("ALTER TABLE prompts ADD COLUMN body_hash TEXT;")?;
+        }
+        let pending = {
+            let mut stmt = conn.prepare("SELECT id, body FROM prompts WHERE body_hash IS NULL")?;
+            let rows = stmt
+                .query_map([], |row| Ok((row.get::<_, String>(0)?, row.get::<_, String>(1)?)))?
+                .collect::<Result<Vec<_>, _>>()?;
+            rows
+        };
+        if !pending.is_empty() {
+            let tx = conn.transaction_with_behavior(TransactionBehavior::Immediate)?;
+            {
+                let mut stmt = tx.prepare("UPDATE prompts SET body_hash = ?2 WHERE id = ?1")?;
+                for (id, body) in &pending {
+                    stmt.execute(params![id, body_hash(body)])?;
+                }
+            }
+            tx.commit()?;
+        }
+        conn.execute_batch("CREATE INDEX IF NOT EXISTS idx_prompts_body_hash ON prompts (body_hash);")?;
         Ok(())
     }
 
     /// Insert a new prompt entry and return the hydrated record.
     pub fn create_prompt(&self, data: NewPrompt) -> Result<Prompt, StorageError> {
+        let _writer = self.write_guard();
         let conn = self.conn()?;
         let id = Uuid::new_v4().to_string();
         let now = Utc::now();
-        conn.execute(
-            r#"
-            INSERT INTO prompts (id, title, body, language, model_hint, metadata, created_at, updated_at)
-            VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8)
-            "#,
-            params![
-                id,
-                data.title,
-                data.body,
-                data.language,
-                data.model_hint,
-                data.metadata.to_string(),
-                now.to_rfc3339(),
-                now.to_rfc3339()
-            ],
-        )?;
-        self.get_prompt(&id)?
-            .ok_or(StorageError::NotFound("prompt".into()))
+        conn.prepare_cached(SQL_INSERT_PROMPT)?.execute(params![
+            id,
+            data.title,
+            data.body,
+            data.language,
+            data.model_hint,
+            data.metadata.to_string(),
+            now.to_rfc3339(),
+            now.to_rfc3339(),
+            body_hash(&data.body)
+        ])?;
+        Ok(Prompt {
+            id,
+            title: data.title,
+            body: data.body,
+            language: data.language,
+            model_hint: data.model_hint,
+            metadata: data.metadata,
+            created_at: now,
+            updated_at: now,
+        })
     }
 
     /// Update an existing prompt in-place. Returns `None` if not found.
     pub fn update_prompt(&self, id: &str, changes: UpdatePrompt) -> Result<Option<Prompt>, StorageError> {
-        let conn = self.conn()?;
+        let _writer = self.write_guard();
         let existing = match self.get_prompt(id)? {
             Some(prompt) => prompt,
             None => return Ok(None),
         };
+        let conn = self.conn()?;
 
         let mut updated = existing;
         if let Some(title) = changes.title {
@@ -146,53 +255,37 @@ impl Storage {
 
         updated.updated_at = Utc::now();
 
-        conn.execute(
-            r#"
-            UPDATE prompts
-            SET title = ?2,
-                body = ?3,
-                language = ?4,
-                model_hint = ?5,
-                metadata = ?6,
-                updated_at = ?7
-            WHERE id = ?1
-            "#,
-            params![
-                id,
-                updated.title,
-                updated.body,
-                updated.language,
-                updated.model_hint,
-                updated.metadata.to_string(),
-                updated.updated_at.to_rfc3339()
-            ],
-        )?;
-
-        self.get_prompt(id)
+        let affected = conn.prepare_cached(SQL_UPDATE_PROMPT)?.execute(params![
+            id,
+            updated.title,
+            updated.body,
+            updated.language,
+            updated.model_hint,
+            updated.metadata.to_string(),
+            updated.updated_at.to_rfc3339(),
+            body_hash(&updated.body)
+        ])?;
+
+        Ok((affected > 0).then_some(updated))
     }
 
     /// Fetch a single prompt.
     pub fn get_prompt(&self, id: &str) -> Result<Option<Prompt>, StorageError> {
         let conn = self.conn()?;
         let prompt = conn
-            .query_row(
-                "SELECT id, title, body, language, model_hint, metadata, created_at, updated_at FROM prompts WHERE id = ?1",
-                params![id],
-                |row| row_to_prompt(row),
-            )
+            .prepare_cached(SQL_SELECT_PROMPT)?
+            .query_row(params![id], |row| row_to_prompt(row))
             .optional()?;
         Ok(prompt)
     }
 
     /// Find a prompt by exact body content (used for clipboard deduplication).
+    /// Looks up the indexed content hash first, then confirms the body matches.
     pub fn find_prompt_by_body(&self, body: &str) -> Result<Option<Prompt>, StorageError> {
         let conn = self.conn()?;
         let prompt = conn
-            .query_row(
-                "SELECT id, title, body, language, model_hint, metadata, created_at, updated_at FROM prompts WHERE body = ?1 LIMIT 1",
-                params![body],
-                |row| row_to_prompt(row),
-            )
+            .prepare_cached(SQL_FIND_PROMPT_BY_BODY)?
+            .query_row(params![body_hash(body), body], |row| row_to_prompt(row))
             .optional()?;
         Ok(prompt)
     }
@@ -212,37 +305,92 @@ impl Storage {
         Ok(rows)
     }
 
+    /// Stream every prompt (most recently updated first) together with its latest
+    /// analysis, handing each row to `visit` as it is read instead of collecting
+    /// the whole table up front.
+    pub fn for_each_prompt_with_latest_analysis<F, E>(&self, mut visit: F) -> Result<(), E>
+    where
+        F: FnMut(Prompt, Option<Analysis>) -> Result<(), E>,
+        E: From<StorageError>,
+    {
+        let conn = self.conn()?;
+        let mut stmt = conn
+            .prepare(
+                "SELECT p.id, p.title, p.body, p.language, p.model_hint, p.metadata, p.created_at, p.updated_at,
+                        a.id, a.prompt_id, a.summary, a.tags, a.classification, a.qwen_model, a.created_at
+                 FROM prompts p
+                 LEFT JOIN analyses a ON a.id = (
+                     SELECT id FROM analyses
+                     WHERE prompt_id = p.id
+                     ORDER BY datetime(created_at) DESC
+                     LIMIT 1
+                 )
+                 ORDER BY datetime(p.updated_at) DESC",
+            )
+            .map_err(StorageError::from)?;
+        let mut rows = stmt.query([]).map_err(StorageError::from)?;
+        while let Some(row) = rows.next().map_err(StorageError::from)? {
+            let prompt = row_to_prompt(row).map_err(StorageError::from)?;
+            let analysis = match row.get::<_, Option<String>>(8).map_err(StorageError::from)? {
+                Some(_) => Some(row_to_analysis_at(row, 8).map_err(StorageError::from)?),
+                None => None,
+            };
+            visit(prompt, analysis)?;
+        }
+        Ok(())
+    }
+
     /// Delete a prompt (analyses/attachments cascade).
     pub fn delete_prompt(&self, id: &str) -> Result<bool, StorageError> {
+        let _writer = self.write_guard();
         let conn = self.conn()?;
-        let affected = conn.execute("DELETE FROM prompts WHERE id = ?1", params![id])?;
+        let affected = conn.prepare_cached(SQL_DELETE_PROMPT)?.execute(params![id])?;
         Ok(affected > 0)
     }
 
+    /// Delete several prompts in one transaction, reusing a single prepared
+    /// statement (analyses/attachments cascade). Returns how many were removed.
+    pub fn delete_prompts(&self, ids: &[String]) -> Result<usize, StorageError> {
+        let _writer = self.write_guard();
+        let mut conn = self.conn()?;
+        let tx = conn.transaction_with_behavior(TransactionBehavior::Immediate)?;
+        let mut affected = 0;
+        {
+            let mut stmt = tx.prepare_cached(SQL_DELETE_PROMPT)?;
+            for id in ids {
+                affected += stmt.execute(params![id])?;
+            }
+        }
+        tx.commit()?;
+        Ok(affected)
+    }
+
     /// Store a new AI analysis result.
     pub fn create_analysis(&self, input: NewAnalysis) -> Result<Analysis, StorageError> {
+        let _writer = self.write_guard();
         let conn = self.conn()?;
         let id = Uuid::new_v4().to_string();
         let created_at = Utc::now();
 
-        conn.execute(
-            r#"
-            INSERT INTO analyses (id, prompt_id, summary, tags, classification, qwen_model, created_at)
-            VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7)
-            "#,
-            params![
-                id,
-                input.prompt_id,
-                input.summary,
-                serde_json::to_string(&input.tags)?,
-                input.classification.to_string(),
-                input.qwen_model,
-                created_at.to_rfc3339()
-            ],
-        )?;
-
-        self.get_analysis(&id)?
-            .ok_or(StorageError::NotFound("analysis".into()))
+        conn.prepare_cached(SQL_INSERT_ANALYSIS)?.execute(params![
+            id,
+            input.prompt_id,
+            input.summary,
+            serde_json::to_string(&input.tags)?,
+            input.classification.to_string(),
+            input.qwen_model,
+            created_at.to_rfc3339()
+        ])?;
+
+        Ok(Analysis {
+            id,
+            prompt_id: input.prompt_id,
+            summary: input.summary,
+            tags: input.tags,
+            classification: input.classification,
+            qwen_model: input.qwen_model,
+            created_at,
+        })
     }
 
     /// Get a specific analysis by ID.
@@ -261,12 +409,7 @@ impl Storage {
     /// List analyses for a prompt.
     pub fn list_analyses_for_prompt(&self, prompt_id: &str) -> Result<Vec<Analysis>, StorageError> {
         let conn = self.conn()?;
-        let mut stmt = conn.prepare(
-            "SELECT id, prompt_id, summary, tags, classification, qwen_model, created_at
-             FROM analyses
-             WHERE prompt_id = ?1
-             ORDER BY datetime(created_at) DESC",
-        )?;
+        let mut stmt = conn.prepare_cached(SQL_LIST_ANALYSES_FOR_PROMPT)?;
 
         let items = stmt
             .query_map(params![prompt_id], |row| row_to_analysis(row))?
@@ -278,21 +421,15 @@ impl Storage {
     pub fn latest_analysis_for_prompt(&self, prompt_id: &str) -> Result<Option<Analysis>, StorageError> {
         let conn = self.conn()?;
         let analysis = conn
-            .query_row(
-                "SELECT id, prompt_id, summary, tags, classification, qwen_model, created_at
-                 FROM analyses
-                 WHERE prompt_id = ?1
-                 ORDER BY datetime(created_at) DESC
-                 LIMIT 1",
-                params![prompt_id],
-                |row| row_to_analysis(row),
-            )
+            .prepare_cached(SQL_LATEST_ANALYSIS_FOR_PROMPT)?
+            .query_row(params![prompt_id], |row| row_to_analysis(row))
             .optional()?;
         Ok(analysis)
     }
 
     /// Store a binary attachment for a prompt.
     pub fn add_attachment(&self, payload: NewAttachment) -> Result<Attachment, StorageError> {
+        let _writer = self.write_guard();
         let conn = self.conn()?;
         let id = Uuid::new_v4().to_string();
         conn.execute(
@@ -302,8 +439,12 @@ impl Storage {
             "#,
             params![id, payload.prompt_id, payload.filename, payload.bytes],
         )?;
-        self.get_attachment(&id)?
-            .ok_or(StorageError::NotFound("attachment".into()))
+        Ok(Attachment {
+            id,
+            prompt_id: payload.prompt_id,
+            filename: payload.filename,
+            bytes: payload.bytes,
+        })
     }
 
     /// Fetch attachment metadata + bytes.
@@ -328,12 +469,24 @@ impl Storage {
 
     /// Remove attachment by id.
     pub fn delete_attachment(&self, id: &str) -> Result<bool, StorageError> {
+        let _writer = self.write_guard();
         let conn = self.conn()?;
         let affected = conn.execute("DELETE FROM attachments WHERE id = ?1", params![id])?;
         Ok(affected > 0)
     }
 }
 
+/// Stable 64-bit FNV-1a digest of a prompt body, hex encoded. Used as an index
+/// key for exact-duplicate lookups; callers still compare the body itself.
+fn body_hash(body: &str) -> String {
+    const OFFSET_BASIS: u64 = 0xcbf2_9ce4_8422_2325;
+    const PRIME: u64 = 0x0000_0100_0000_01b3;
+    let hash = body
+        .bytes()
+        .fold(OFFSET_BASIS, |hash, byte| (hash ^ u64::from(byte)).wrapping_mul(PRIME));
+    format!("{hash:016x}")
+}
+
 fn row_to_prompt(row: &rusqlite::Row<'_>) -> rusqlite::Result<Prompt> {
     Ok(Prompt {
         id: row.get(0)?,
@@ -341,24 +494,44 @@ fn row_to_prompt(row: &rusqlite::Row<'_>) -> rusqlite::Result<Prompt> {
         body: row.get(2)?,
         language: row.get(3)?,
         model_hint: row.get(4)?,
-        metadata: serde_json::from_str::<Value>(&row.get::<_, String>(5)?).unwrap_or(Value::Null),
-        created_at: parse_datetime(&row.get::<_, String>(6)?)?,
-        updated_at: parse_datetime(&row.get::<_, String>(7)?)?,
+        metadata: serde_json::from_str::<Value>(text_ref(row, 5)?).unwrap_or(Value::Null),
+        created_at: parse_datetime(text_ref(row, 6)?)?,
+        updated_at: parse_datetime(text_ref(row, 7)?)?,
     })
 }
 
 fn row_to_analysis(row: &rusqlite::Row<'_>) -> rusqlite::Result<Analysis> {
+    row_to_analysis_at(row, 0)
+}
+
+/// Map analysis columns starting at `offset` (for joins that select prompt columns first).
+fn row_to_analysis_at(row: &rusqlite::Row<'_>, offset: usize) -> rusqlite::Result<Analysis> {
     Ok(Analysis {
-        id: row.get(0)?,
-        prompt_id: row.get(1)?,
-        summary: row.get(2)?,
-        tags: serde_json::from_str::<Vec<String>>(&row.get::<_, String>(3)?).unwrap_or_default(),
-        classification: serde_json::from_str::<Value>(&row.get::<_, String>(4)?).unwrap_or(Value::Null),
-        qwen_model: row.get(5)?,
-        created_at: parse_datetime(&row.get::<_, String>(6)?)?,
+        id: row.get(offset)?,
+        prompt_id: row.get(offset + 1)?,
+        summary: row.get(offset + 2)?,
+        tags: serde_json::from_str::<Vec<String>>(text_ref(row, offset + 3)?).unwrap_or_default(),
+        classification: serde_json::from_str::<Value>(text_ref(row, offset + 4)?).unwrap_or(Value::Null),
+        qwen_model: row.get(offset + 5)?,
+        created_at: parse_datetime(text_ref(row, offset + 6)?)?,
     })
 }
 
+/// Borrow a TEXT column straight from the row so JSON/timestamp parsing does not
+/// need an intermediate owned `String` per column. Errors match `row.get::<_, String>`.
+fn text_ref<'a>(row: &'a rusqlite::Row<'_>, idx: usize) -> rusqlite::Result<&'a str> {
+    let value = row.get_ref(idx)?;
+    match value.as_str() {
+        Ok(text) => Ok(text),
+        Err(FromSqlError::InvalidType) => Err(rusqlite::Error::InvalidColumnType(
+            idx,
+            row.as_ref().column_name(idx)?.to_owned(),
+            value.data_type(),
+        )),
+        Err(err) => Err(rusqlite::Error::FromSqlConversionFailure(idx, value.data_type(), Box::new(err))),
+    }
+}
+
 fn parse_datetime(value: &str) -> rusqlite::Result<DateTime<Utc>> {
     DateTime::parse_from_rfc3339(value)
         .map(|dt| dt.with_timezone(&Utc))
@@ -468,3 +641,174 @@ pub enum StorageError {
     #[error(transparent)]
     Json(#[from] serde_json::Error),
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn temp_db_path(label: &str) -> std::path::PathBuf {
+        std::env::temp_dir().join(format!("promptlab-{label}-{}.db", Uuid::new_v4()))
+    }
+
+    fn remove_db_files(db_path: &Path) {
+        for suffix in ["", "-wal", "-shm"] {
+            let mut path = db_path.to_path_buf().into_os_string();
+            path.push(suffix);
+            let _ = std::fs::remove_file(path);
+        }
+    }
+
+    fn analysis_for(prompt_id: &str, summary: &str) -> NewAnalysis {
+        NewAnalysis {
+            prompt_id: prompt_id.to_string(),
+            summary: summary.to_string(),
+            tags: vec![summary.to_string()],
+            classification: Value::Null,
+            qwen_model: None,
+        }
+    }
+
+    #[test]
+    fn migration_backfills_body_hash_for_existing_rows() {
+        let db_path = temp_db_path("migration");
+        let rows = [
+            ("legacy-1", "Summarise the following article."),
+            ("legacy-2", "请把下面的段落翻译成英文。"),
+        ];
+        {
+            let conn = rusqlite::Connection::open(&db_path).unwrap();
+            conn.execute_batch(
+                r#"
+                CREATE TABLE prompts (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    language TEXT,
+                    model_hint TEXT,
+                    metadata TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                "#,
+            )
+            .unwrap();
+            let now = Utc::now().to_rfc3339();
+            for (id, body) in &rows {
+                conn.execute(
+                    "INSERT INTO prompts (id, title, body, language, model_hint, metadata, created_at, updated_at)
+                     VALUES (?1, ?2, ?3, NULL, NULL, '{}', ?4, ?4)",
+                    params![id, id, body, now],
+                )
+                .unwrap();
+            }
+        }
+
+        // Opening twice checks the migration is idempotent on an already-migrated file.
+        drop(Storage::new(&db_path).unwrap());
+        let storage = Storage::new(&db_path).unwrap();
+
+        let conn = storage.conn().unwrap();
+        let missing: i64 = conn
+            .query_row("SELECT COUNT(*) FROM prompts WHERE body_hash IS NULL", [], |row| row.get(0))
+            .unwrap();
+        assert_eq!(missing, 0);
+        for (id, body) in &rows {
+            let stored: String = conn
+                .query_row("SELECT body_hash FROM prompts WHERE id = ?1", params![id], |row| row.get(0))
+                .unwrap();
+            assert_eq!(stored, body_hash(body));
+            let found = storage.find_prompt_by_body(body).unwrap().expect("legacy prompt found by body");
+            assert_eq!(found.id, *id);
+        }
+        drop(conn);
+        drop(storage);
+        remove_db_files(&db_path);
+    }
+
+    #[test]
+    fn export_cursor_pairs_each_prompt_with_its_latest_analysis() {
+        let db_path = temp_db_path("export");
+        let storage = Storage::new(&db_path).unwrap();
+        let bare = storage.create_prompt(NewPrompt::new("bare", "No analyses yet.")).unwrap();
+        let analysed = storage.create_prompt(NewPrompt::new("analysed", "Analysed twice.")).unwrap();
+        let older = storage.create_analysis(analysis_for(&analysed.id, "older")).unwrap();
+        let newer = storage.create_analysis(analysis_for(&analysed.id, "newer")).unwrap();
+
+        // `datetime()` ordering is per second, so spread the timestamps explicitly.
+        let conn = storage.conn().unwrap();
+        conn.execute(
+            "UPDATE prompts SET updated_at = ?2 WHERE id = ?1",
+            params![bare.id, "2024-01-01T00:00:00+00:00"],
+        )
+        .unwrap();
+        conn.execute(
+            "UPDATE prompts SET updated_at = ?2 WHERE id = ?1",
+            params![analysed.id, "2024-01-02T00:00:00+00:00"],
+        )
+        .unwrap();
+        conn.execute(
+            "UPDATE analyses SET created_at = ?2 WHERE id = ?1",
+            params![older.id, "2024-01-01T00:00:00+00:00"],
+        )
+        .unwrap();
+        conn.execute(
+            "UPDATE analyses SET created_at = ?2 WHERE id = ?1",
+            params![newer.id, "2024-01-03T00:00:00+00:00"],
+        )
+        .unwrap();
+        drop(conn);
+
+        let mut visited = Vec::new();
+        storage
+            .for_each_prompt_with_latest_analysis(|prompt, latest| -> Result<(), StorageError> {
+                visited.push((prompt.id, latest.map(|analysis| (analysis.id, analysis.summary))));
+                Ok(())
+            })
+            .unwrap();
+
+        let listed: Vec<String> = storage.list_prompts().unwrap().into_iter().map(|prompt| prompt.id).collect();
+        let streamed: Vec<String> = visited.iter().map(|(id, _)| id.clone()).collect();
+        assert_eq!(streamed, listed);
+        assert_eq!(streamed, vec![analysed.id.clone(), bare.id.clone()]);
+        assert_eq!(visited[0].1, Some((newer.id, "newer".to_string())));
+        assert_eq!(visited[1].1, None);
+
+        drop(storage);
+        remove_db_files(&db_path);
+    }
+
+    #[test]
+    fn delete_prompts_counts_removed_rows_and_cascades_analyses() {
+        let db_path = temp_db_path("delete");
+        let storage = Storage::new(&db_path).unwrap();
+        let first = storage.create_prompt(NewPrompt::new("first", "First body.")).unwrap();
+        let second = storage.create_prompt(NewPrompt::new("second", "Second body.")).unwrap();
+        let kept = storage.create_prompt(NewPrompt::new("kept", "Kept body.")).unwrap();
+        storage.create_analysis(analysis_for(&first.id, "first")).unwrap();
+        storage.create_analysis(analysis_for(&second.id, "second")).unwrap();
+        storage.create_analysis(analysis_for(&kept.id, "kept")).unwrap();
+
+        let ids = vec![first.id.clone(), "missing".to_string(), second.id.clone()];
+        assert_eq!(storage.delete_prompts(&ids).unwrap(), 2);
+
+        let remaining: Vec<String> = storage.list_prompts().unwrap().into_iter().map(|prompt| prompt.id).collect();
+        assert_eq!(remaining, vec![kept.id.clone()]);
+        assert!(storage.list_analyses_for_prompt(&first.id).unwrap().is_empty());
+        assert!(storage.list_analyses_for_prompt(&second.id).unwrap().is_empty());
+        assert_eq!(storage.list_analyses_for_prompt(&kept.id).unwrap().len(), 1);
+
+        let conn = storage.conn().unwrap();
+        let orphans: i64 = conn
+            .query_row(
+                "SELECT COUNT(*) FROM analyses WHERE prompt_id NOT IN (SELECT id FROM prompts)",
+                [],
+                |row| row.get(0),
+            )
+            .unwrap();
+        assert_eq!(orphans, 0);
+        drop(conn);
+
+        drop(storage);
+        remove_db_files(&db_path);
+    }
+}